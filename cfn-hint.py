@@ -2,11 +2,30 @@
 
 import sys
 import argparse
+import hashlib
+import io
 import logging
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache, partial
+from itertools import chain
 from pathlib import Path
 from difflib import unified_diff
-from colorama import init, Fore
+from colorama import init, Fore, Style
+
+# Prefer the third-party 'regex' module when available: hint patterns come
+# from template authors, and regex supports a timeout= kwarg that bounds
+# catastrophic backtracking (ReDoS). Falls back to stdlib re otherwise.
+try:
+    import regex as _re
+    _HAS_REGEX = True
+except ImportError:
+    _re = re
+    _HAS_REGEX = False
+
+# Per-substitution time budget (seconds) when the regex module is in use
+_SUB_TIMEOUT = 0.25
 
 # === Exit Code Constants ===
 EXIT_SUCCESS = 0
@@ -17,6 +36,28 @@ EXIT_FILE_WRITE_ERROR = 4
 EXIT_REGEX_ERROR = 6
 EXIT_INTERNAL_ERROR = 8
 
+# ANSI constants resolved once, not per diff line
+_FG_GREEN = Fore.GREEN
+_FG_RED = Fore.RED
+_FG_CYAN = Fore.CYAN
+_RESET = Style.RESET_ALL
+
+# Locates a hint comment and its target (following) line in one pass over
+# the whole buffer, so the scan runs in the regex engine instead of a
+# Python-level loop per line. Compiled as a bytes pattern: content stays
+# bytes end-to-end, skipping a UTF-8 decode and re-encode per file.
+# Expected hint format: '# cfn-hint: replace: <pattern> with: <replacement>'
+_HINT_BLOCK = _re.compile(
+    rb"(?P<hint>[^\n]*#[ \t]*cfn-hint:[ \t]*replace:[ \t]*(?P<pat>[^\n]*?)"
+    rb"[ \t]+with:[ \t]*(?P<rep>[^\n]*?)[ \t\r]*(?:\n|\Z))"
+    rb"(?P<target>[^\n]*\n?)"
+)
+
+# Looser marker used on the stretches _HINT_BLOCK did not match, so hint
+# lines that fail to parse (e.g. missing the 'with:' clause) are still
+# reported instead of silently passing through
+_HINT_MARKER = _re.compile(rb"[^\n]*#[ \t]*cfn-hint:[ \t]*replace:[^\n]*")
+
 def setup_logging(log_file=None, quiet=False):
     """Configures logging to file or stderr."""
     if quiet:
@@ -32,76 +73,137 @@ def setup_logging(log_file=None, quiet=False):
         logging.basicConfig(level=log_level, format=log_format, stream=sys.stderr)
 
 
-def parse_hint(hint_line):
+@lru_cache(maxsize=256)
+def _compile_hint(pattern):
     """
-    Parses a hint comment to extract the regex pattern and replacement string.
-    Expected format: '# cfn-hint: replace: <pattern> with: <replacement>'
+    Compiles the (bytes) regex pattern extracted from a hint comment.
+    Cached so templates repeating the same hint only pay for one compile.
     """
     try:
-        # Get text after the second colon (i.e., after "cfn-hint: replace:")
-        parts = hint_line.split(':', 2)[-1].strip()
-        # Split on the first ' with: ' to separate pattern and replacement
-        pattern, replacement = parts.split(' with: ', 1)
-        return pattern, replacement
-    except (ValueError, IndexError) as e:
+        return _re.compile(pattern)
+    except _re.error as e:
         raise ValueError(
-            "Invalid hint format. Expected '# cfn-hint: replace: <pattern> with: <replacement>'."
-            f" Error: {e}"
+            f"Invalid regex pattern: '{pattern.decode('utf-8', 'replace')}'. Details: {e}"
         )
 
 
-def replace_line(line, pattern, replacement):
-    """Applies a regex substitution to a single line."""
-    try:
-        # Validate pattern compiles
-        re.compile(pattern)
-        return re.sub(pattern, replacement, line)
-    except re.error as e:
-        raise ValueError(f"Invalid regex pattern: '{pattern}'. Details: {e}")
+def replace_line(line, compiled, replacement):
+    """
+    Applies a pre-compiled regex substitution to a single line.
+    Returns (result, changed); the subn count is a free prefilter, and the
+    equality check confirming the content really differs (a substitution can
+    reproduce the matched text) is only paid on lines that substituted.
+    """
+    if _HAS_REGEX:
+        result, n_subs = compiled.subn(replacement, line, timeout=_SUB_TIMEOUT)
+    else:
+        result, n_subs = compiled.subn(replacement, line)
+    return result, n_subs > 0 and result != line
+
+
+def _log_malformed_hints(segment):
+    """Logs an error for each hint-like line in a stretch of unmatched content."""
+    for marker in _HINT_MARKER.finditer(segment):
+        logging.error(
+            "Skipping hint due to error: Invalid hint format. Expected "
+            "'# cfn-hint: replace: <pattern> with: <replacement>'. "
+            f"Got: {marker.group().strip().decode('utf-8', 'replace')}"
+        )
 
 
 def process_content(content):
     """
-    Processes the input content line by line, applies hints, and returns modified content.
-    Preserves original line endings by using splitlines(keepends=True).
+    Processes full in-memory content (bytes) and returns
+    (modified_content, changed). Scans the whole buffer with _HINT_BLOCK so
+    the interpreter loops once per hint rather than once per line; the
+    stretches between hints are copied over untouched. The changed flag is
+    tracked during substitution, so callers never need an O(n) comparison
+    of the two buffers.
     """
-    modified_lines = []
-    lines_iter = iter(content.splitlines(keepends=True))
-
-    for line in lines_iter:
-        if "# cfn-hint: replace:" in line:
-            # Keep the hint line itself
-            modified_lines.append(line)
-            # Attempt to parse the hint
-            try:
-                pattern, replacement = parse_hint(line)
-            except ValueError as e:
-                logging.error(f"Skipping hint due to error: {e}")
-                # Do not consume the next line; continue so next line is processed normally
-                continue
+    # Cheap substring prefilter: a single C-level scan short-circuits the
+    # regex machinery entirely for hint-less content (e.g. stdin input,
+    # which skips the file-level sentinel check)
+    if b"cfn-hint:" not in content:
+        return content, False
+
+    buf = io.BytesIO()
+    changed = False
+    pos = 0
+
+    while True:
+        block = _HINT_BLOCK.search(content, pos)
+        if block is None:
+            break
+
+        # Copy everything up to and including the hint line untouched,
+        # reporting any malformed hints skipped over in the gap
+        _log_malformed_hints(content[pos:block.start()])
+        buf.write(content[pos:block.start()])
+        hint_line = block.group('hint')
+        buf.write(hint_line)
+
+        # An empty pattern (e.g. 'replace: with: X') would compile to a regex
+        # matching at every position; treat it as a malformed hint instead
+        if not block.group('pat'):
+            logging.error(
+                "Skipping hint due to error: Invalid hint format. Expected "
+                "'# cfn-hint: replace: <pattern> with: <replacement>'. "
+                f"Got: {hint_line.strip().decode('utf-8', 'replace')}"
+            )
+            pos = block.end('hint')
+            continue
 
-            # Consume the next line to apply replacement
-            try:
-                next_line = next(lines_iter)
-            except StopIteration:
-                logging.warning(f"Hint at EOF with no subsequent line to process: {line.strip()}")
-                continue
+        # Attempt to compile the hint's pattern
+        try:
+            compiled = _compile_hint(block.group('pat'))
+        except ValueError as e:
+            logging.error(f"Skipping hint due to error: {e}")
+            # Do not consume the target line; resume scanning right after the
+            # hint so the next line is processed normally
+            pos = block.end('hint')
+            continue
 
-            # Attempt to apply regex replacement
-            try:
-                modified_line = replace_line(next_line, pattern, replacement)
-            except ValueError as e:
-                logging.error(f"Skipping replacement due to invalid regex: {e}")
-                # Append the unmodified next line
-                modified_lines.append(next_line)
-                continue
-
-            # Append the replaced line
-            modified_lines.append(modified_line)
+        target_line = block.group('target')
+        if not target_line:
+            logging.warning(
+                "Hint at EOF with no subsequent line to process: "
+                f"{hint_line.strip().decode('utf-8', 'replace')}"
+            )
+            pos = block.end()
+            continue
+
+        # Split the line ending off the target so $-anchored patterns match
+        # on CRLF files too (universal newlines used to strip the \r)
+        if target_line.endswith(b"\r\n"):
+            target_body, target_eol = target_line[:-2], b"\r\n"
+        elif target_line.endswith(b"\n"):
+            target_body, target_eol = target_line[:-1], b"\n"
         else:
-            modified_lines.append(line)
+            target_body, target_eol = target_line, b""
+
+        # Attempt to apply regex replacement
+        try:
+            modified_line, line_changed = replace_line(target_body, compiled, block.group('rep'))
+        except TimeoutError:
+            logging.error(f"Skipping replacement: pattern timed out after {_SUB_TIMEOUT}s")
+            buf.write(target_line)
+            pos = block.end()
+            continue
+        except _re.error as e:
+            logging.error(f"Skipping replacement due to invalid regex: {e}")
+            # Keep the unmodified target line
+            buf.write(target_line)
+            pos = block.end()
+            continue
+
+        buf.write(modified_line + target_eol)
+        changed = changed or line_changed
+        pos = block.end()
 
-    return "".join(modified_lines)
+    # Tail after the last hint block
+    _log_malformed_hints(content[pos:])
+    buf.write(content[pos:])
+    return buf.getvalue(), changed
 
 
 def print_diff(original_content, modified_content, file_name=""):
@@ -114,27 +216,122 @@ def print_diff(original_content, modified_content, file_name=""):
         tofile=f'modified{display_name}',
     )
 
-    diff_output = list(diff_lines)
-    if not diff_output:
-        print(Fore.GREEN + f"No changes detected for{display_name}.")
+    # Peek at the first line rather than materializing the whole diff just
+    # to test for emptiness
+    first = next(diff_lines, None)
+    if first is None:
+        print(_FG_GREEN + f"No changes detected for{display_name}.")
         return
 
-    for line in diff_output:
+    # Accumulate the colored diff and flush it with a single write; per-line
+    # print calls pay the stdout lock and colorama reset cost every time
+    out = []
+    for line in chain((first,), diff_lines):
         if line.startswith('+++') or line.startswith('---'):
-            # Print file header lines without color
-            print(line, end='')
+            # File header lines without color
+            out.append(line)
         elif line.startswith('@@'):
             # Hunk header in cyan
-            print(Fore.CYAN + line, end='')
+            out.append(_FG_CYAN + line + _RESET)
         elif line.startswith('+'):
             # Added line in green
-            print(Fore.GREEN + line, end='')
+            out.append(_FG_GREEN + line + _RESET)
         elif line.startswith('-'):
             # Removed line in red
-            print(Fore.RED + line, end='')
+            out.append(_FG_RED + line + _RESET)
         else:
             # Context line or other metadata
-            print(line, end='')
+            out.append(line)
+
+    sys.stdout.write("".join(out))
+
+
+def _read_bytes(file_path):
+    """Reads a file's raw bytes; also used by the prefetch thread."""
+    return file_path.read_bytes()
+
+
+def _process_one_file(file_path, output_dir=None, show_diff=False, raw=None):
+    """
+    Reads and processes a single file; safe to run in a worker process.
+    Accepts pre-read bytes via raw to support prefetching. Returns
+    (file_path, exit_code, stdout_text) where stdout_text is content for
+    the caller to print in stdout mode, or None.
+    """
+    logging.info(f"Processing file: {file_path}")
+
+    try:
+        if raw is None:
+            raw = _read_bytes(file_path)
+    except Exception as e:
+        logging.error(f"Error reading file {file_path}: {e}")
+        return file_path, EXIT_FILE_READ_ERROR, None
+
+    # Fast bytes-level scan: hint-less files need no decode or processing
+    if b"cfn-hint:" not in raw:
+        logging.info(f"No hints found in {file_path}; skipping.")
+        return file_path, EXIT_SUCCESS, None
+
+    try:
+        modified_content, changed = process_content(raw)
+    except Exception as e:
+        logging.error(f"An internal error occurred while processing {file_path}: {e}", exc_info=True)
+        return file_path, EXIT_INTERNAL_ERROR, None
+
+    # If no changes, skip writing or printing
+    if not changed:
+        logging.info(f"No changes made to {file_path}.")
+        return file_path, EXIT_SUCCESS, None
+
+    # If diff was requested, print the colored diff (the only path that
+    # needs text, so the only one that pays for a decode)
+    if show_diff:
+        try:
+            print_diff(
+                raw.decode("utf-8"),
+                modified_content.decode("utf-8"),
+                file_name=str(file_path),
+            )
+        except UnicodeDecodeError as e:
+            logging.error(f"Error reading file {file_path}: {e}")
+            return file_path, EXIT_FILE_READ_ERROR, None
+        return file_path, EXIT_SUCCESS, None
+
+    # If output directory specified, write out the modified file
+    if output_dir:
+        output_path = output_dir / file_path.name
+        new_bytes = modified_content
+        # Include the pid so pool workers handling same-named inputs never
+        # share a temp path
+        tmp_path = output_path.with_suffix(f"{output_path.suffix}.{os.getpid()}.tmp")
+        try:
+            # Skip the write entirely when the existing output is already
+            # identical, so downstream tooling sees no spurious mtime bump
+            if output_path.exists():
+                old_digest = hashlib.blake2b(output_path.read_bytes(), digest_size=16).digest()
+                new_digest = hashlib.blake2b(new_bytes, digest_size=16).digest()
+                if old_digest == new_digest:
+                    logging.info(f"Output at {output_path} is already up to date; skipping write.")
+                    return file_path, EXIT_SUCCESS, None
+
+            # Write through a temp file and rename, so a failed write never
+            # leaves a truncated output behind
+            tmp_path.write_bytes(new_bytes)
+            os.replace(tmp_path, output_path)
+            logging.info(f"Successfully wrote modified file to {output_path}")
+        except OSError as e:
+            logging.error(f"Failed to write to output file {output_path}: {e}")
+            # Never leave a partial temp file behind
+            try:
+                tmp_path.unlink(missing_ok=True)
+            except OSError:
+                pass
+            return file_path, EXIT_FILE_WRITE_ERROR, None
+        return file_path, EXIT_SUCCESS, None
+
+    # Otherwise, hand the modified content back for the caller to print
+    header = f"--- # Modified content for {file_path}\n".encode("utf-8")
+    return file_path, EXIT_SUCCESS, header + modified_content + b"\n"
 
 
 def parse_args():
@@ -195,45 +392,85 @@ def main():
         # === STDIN MODE ===
         logging.info("Reading from stdin...")
         try:
-            original_content = sys.stdin.read()
+            original_content = sys.stdin.buffer.read()
         except Exception as e:
             logging.error(f"Error reading stdin: {e}", exc_info=True)
             return EXIT_FILE_READ_ERROR
 
         try:
-            modified_content = process_content(original_content)
+            modified_content, _ = process_content(original_content)
+            if args.diff:
+                print_diff(original_content.decode("utf-8"), modified_content.decode("utf-8"))
+            else:
+                sys.stdout.buffer.write(modified_content + b"\n")
+        except UnicodeDecodeError as e:
+            logging.error(f"Error reading stdin: {e}")
+            return EXIT_FILE_READ_ERROR
         except Exception as e:
             logging.error(f"An internal error occurred while processing stdin: {e}", exc_info=True)
             return EXIT_INTERNAL_ERROR
 
-        if args.diff:
-            print_diff(original_content, modified_content)
-        else:
-            print(modified_content)
-
         return EXIT_SUCCESS
 
     # === FILE MODE ===
     cwd = Path.cwd()
-    files_to_process = set()
+    # Deduplicate on plain path strings: hashing str avoids the parse and
+    # normalisation cost of PurePath.__hash__ on every match. The list keeps
+    # the working set sortable in place without a separate sorted() copy.
+    files_to_process = []
+    seen_paths = set()
+
+    def add_file(s):
+        if s not in seen_paths:
+            seen_paths.add(s)
+            files_to_process.append(s)
+
+    def collect(matched_iter, pattern):
+        # Stream matches lazily; never buffer the full match set in memory
+        any_matched = False
+        for f in matched_iter:
+            any_matched = True
+            s = os.fspath(f)
+            if os.path.isfile(s):
+                add_file(s)
+
+        if not any_matched:
+            logging.warning(f"No files matched the pattern: {pattern}")
 
-    # Expand each input pattern
+    # Partition the input patterns once, so each group dispatches to the
+    # cheapest expansion method without re-testing every pattern in the loop
+    literals, absolute_globs, recursive_globs, relative_globs = [], [], [], []
     for pattern in args.input:
-        p = Path(pattern)
-        if p.is_absolute():
-            # If absolute path, use parent.glob on the final name
-            matched = list(p.parent.glob(p.name))
+        if not any(c in pattern for c in "*?["):
+            literals.append(pattern)
+        elif os.path.isabs(pattern):
+            absolute_globs.append(pattern)
+        elif "**" in pattern:
+            recursive_globs.append(pattern)
+        else:
+            relative_globs.append(pattern)
+
+    # Literal paths (no wildcard) need no directory scan at all
+    for pattern in literals:
+        s = pattern if os.path.isabs(pattern) else os.path.join(str(cwd), pattern)
+        # Normalize so spellings like ./in/a.yml and in/a.yml deduplicate
+        # against each other and against glob results
+        s = os.path.normpath(s)
+        if os.path.isfile(s):
+            add_file(s)
         else:
-            # If pattern contains '**', use rglob; else use glob
-            glob_method = cwd.rglob if "**" in pattern else cwd.glob
-            matched = list(glob_method(pattern))
-
-        if not matched:
             logging.warning(f"No files matched the pattern: {pattern}")
 
-        for f in matched:
-            if f.is_file():
-                files_to_process.add(f)
+    # Absolute globs expand via parent.glob on the final name
+    for pattern in absolute_globs:
+        p = Path(pattern)
+        collect(p.parent.glob(p.name), pattern)
+
+    # '**' patterns need rglob; plain relative globs use glob
+    for pattern in recursive_globs:
+        collect(cwd.rglob(pattern), pattern)
+    for pattern in relative_globs:
+        collect(cwd.glob(pattern), pattern)
 
     if not files_to_process:
         logging.error("No input files were found matching the provided patterns.")
@@ -248,45 +485,44 @@ def main():
             logging.error(f"Could not create output directory '{args.output_dir}': {e}")
             return EXIT_FILE_WRITE_ERROR
 
-    # Process each file
-    for file_path in sorted(files_to_process):
-        logging.info(f"Processing file: {file_path}")
-        try:
-            original_content = file_path.read_text(encoding="utf-8")
-        except Exception as e:
-            logging.error(f"Error reading file {file_path}: {e}")
-            overall_exit_code = max(overall_exit_code, EXIT_FILE_READ_ERROR)
-            continue
-
-        try:
-            modified_content = process_content(original_content)
-        except Exception as e:
-            logging.error(f"An internal error occurred while processing {file_path}: {e}", exc_info=True)
-            overall_exit_code = max(overall_exit_code, EXIT_INTERNAL_ERROR)
-            continue
-
-        # If no changes, skip writing or printing
-        if original_content == modified_content:
-            logging.info(f"No changes made to {file_path}.")
-            continue
-
-        # If diff was requested, print colored diff
-        if args.diff:
-            print_diff(original_content, modified_content, file_name=str(file_path))
-
-        # Else if output directory specified, write out the modified file
-        elif args.output_dir:
-            output_path = args.output_dir / file_path.name
-            try:
-                output_path.write_text(modified_content, encoding="utf-8")
-                logging.info(f"Successfully wrote modified file to {output_path}")
-            except Exception as e:
-                logging.error(f"Failed to write to output file {output_path}: {e}")
-                overall_exit_code = max(overall_exit_code, EXIT_FILE_WRITE_ERROR)
-
-        # Otherwise, print the modified content to stdout
-        else:
-            print(f"--- # Modified content for {file_path}\n{modified_content}")
+    # Sort the strings in place for deterministic order (string comparison is
+    # cheaper than Path.__lt__) and construct Path objects only at consumption
+    files_to_process.sort()
+    files = [Path(s) for s in files_to_process]
+
+    # Files are independent units of work; fan out across cores when there is
+    # more than one. Diff mode stays sequential so output is not interleaved.
+    if len(files) > 1 and not args.diff:
+        worker = partial(_process_one_file, output_dir=args.output_dir)
+        # Re-run logging setup in each worker: under the spawn/forkserver
+        # start methods workers do not inherit the parent's configuration
+        with ProcessPoolExecutor(
+            initializer=setup_logging, initargs=(args.log, args.quiet)
+        ) as executor:
+            for _, exit_part, stdout_text in executor.map(worker, files, chunksize=8):
+                overall_exit_code = max(overall_exit_code, exit_part)
+                if stdout_text is not None:
+                    sys.stdout.buffer.write(stdout_text)
+    else:
+        # Overlap the next file's disk read with processing of the current
+        # one via a one-ahead prefetch thread (read_bytes releases the GIL)
+        with ThreadPoolExecutor(max_workers=1) as prefetcher:
+            prefetched = prefetcher.submit(_read_bytes, files[0])
+            for i, file_path in enumerate(files):
+                try:
+                    raw = prefetched.result()
+                except Exception:
+                    # Fall back to a direct read so the error is reported once
+                    raw = None
+                if i + 1 < len(files):
+                    prefetched = prefetcher.submit(_read_bytes, files[i + 1])
+
+                _, exit_part, stdout_text = _process_one_file(
+                    file_path, output_dir=args.output_dir, show_diff=args.diff, raw=raw
+                )
+                overall_exit_code = max(overall_exit_code, exit_part)
+                if stdout_text is not None:
+                    sys.stdout.buffer.write(stdout_text)
 
     return overall_exit_code
 